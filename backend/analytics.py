@@ -1,14 +1,42 @@
 import numpy as np
-from typing import Dict, List
+from collections import deque
+from functools import lru_cache
+from typing import Dict, List, Tuple
 from models import Train
+from analytics_kernels import _scenario_metrics
 from reinforcement_learning import rl_system
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Size of the sandbox result history and of the window averaged for efficiency
+SANDBOX_HISTORY = 50
+EFFICIENCY_WINDOW = 10
+
+# Punctuality and average delay reported when there are no trains to analyse
+_DEFAULT_TRAIN_STATS = (85.0, 8.5)
+
+def _to_arrays(trains: List[Train]):
+    """Extract delay, passenger and on-time columns from trains"""
+    # np.fromiter per column beats filling preallocated arrays element by
+    # element, where every store goes through NumPy's scalar conversion
+    n = len(trains)
+    delays = np.fromiter((train.delayMinutes for train in trains), dtype=np.int32, count=n)
+    passengers = np.fromiter((train.passengers or 0 for train in trains), dtype=np.int32, count=n)
+    on_time = np.fromiter((train.status == "on-time" for train in trains), dtype=bool, count=n)
+    
+    return delays, passengers, on_time
+
 class AnalyticsEngine:
     def __init__(self):
-        self.sandbox_results = []
+        # Only the last 50 results are kept
+        self.sandbox_results = deque(maxlen=SANDBOX_HISTORY)
+        # Ring buffer mirroring the efficiency of each result in sandbox_results
+        self._eff_buf = np.full(SANDBOX_HISTORY, np.nan)
+        self._eff_idx = 0
+        self._eff_count = 0
+        # Bumped on every recorded sandbox result so callers can cache metrics
+        self.version = 0
         
     def calculate_performance_metrics(self, trains: List[Train] = None) -> Dict:
         """Calculate comprehensive performance analytics"""
@@ -16,23 +44,18 @@ class AnalyticsEngine:
         # Get RL analytics
         rl_analytics = rl_system.get_analytics()
         
-        # Calculate train punctuality
-        if trains:
-            on_time_trains = sum(1 for train in trains if train.status == "on-time")
-            punctuality = (on_time_trains / len(trains)) * 100 if trains else 0
-            
-            # Calculate average delay
-            total_delay = sum(train.delayMinutes for train in trains)
-            avg_delay = total_delay / len(trains) if trains else 0
-        else:
-            punctuality = 85.0  # Default value
-            avg_delay = 8.5
+        # Calculate train punctuality and average delay
+        punctuality, avg_delay = self._calculate_train_stats(trains)
         
         # Calculate sandbox efficiency (average of recent results)
         sandbox_efficiency = 75.0  # Default
-        if self.sandbox_results:
-            recent_results = self.sandbox_results[-10:]  # Last 10 results
-            sandbox_efficiency = np.mean([r.get("efficiency", 75) for r in recent_results])
+        if self._eff_count:
+            window = min(EFFICIENCY_WINDOW, self._eff_count)  # Last 10 results
+            recent = self._eff_buf.take(
+                range(self._eff_idx - window, self._eff_idx), mode="wrap"
+            )
+            # Left as np.float64, as np.mean returned before, so it is rounded the same way
+            sandbox_efficiency = recent.mean()
         
         # Decision success rate
         decision_success_rate = rl_analytics["acceptanceRate"] * 100
@@ -59,7 +82,25 @@ class AnalyticsEngine:
             )
         }
     
-    def _calculate_system_health(self, punctuality: float, decision_success_rate: float) -> str:
+    def _calculate_train_stats(self, trains: List[Train] = None) -> Tuple[float, float]:
+        """Calculate train punctuality and average delay"""
+        n = len(trains) if trains else 0
+        if not n:
+            return _DEFAULT_TRAIN_STATS
+        
+        delays, _, on_time = _to_arrays(trains)
+        on_time_trains = int(np.count_nonzero(on_time))
+        punctuality = (on_time_trains / n) * 100
+        
+        # Calculate average delay
+        total_delay = int(delays.sum())
+        avg_delay = total_delay / n
+        
+        return punctuality, avg_delay
+    
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _calculate_system_health(punctuality: float, decision_success_rate: float) -> str:
         """Calculate overall system health status"""
         health_score = (punctuality + decision_success_rate) / 2
         
@@ -84,10 +125,9 @@ class AnalyticsEngine:
         if decision_success_rate < 60:
             recommendations.append("Review AI decision parameters")
         
-        if "safety" in rl_analytics["topRejectionReasons"]:
-            safety_count = rl_analytics["topRejectionReasons"]["safety"]
-            if safety_count > 3:
-                recommendations.append("Strengthen safety constraints in AI model")
+        safety_count = rl_analytics["topRejectionReasons"].get("safety", 0)
+        if safety_count > 3:
+            recommendations.append("Strengthen safety constraints in AI model")
         
         if rl_analytics["totalDecisions"] < 10:
             recommendations.append("Increase AI decision frequency for better optimization")
@@ -100,29 +140,25 @@ class AnalyticsEngine:
     def record_sandbox_result(self, result: Dict):
         """Record a sandbox simulation result"""
         self.sandbox_results.append(result)
+        self.version += 1
         
-        # Keep only last 50 results
-        if len(self.sandbox_results) > 50:
-            self.sandbox_results = self.sandbox_results[-50:]
+        self._eff_buf[self._eff_idx] = result.get("efficiency", 75)
+        self._eff_idx = (self._eff_idx + 1) % SANDBOX_HISTORY
+        self._eff_count = min(self._eff_count + 1, SANDBOX_HISTORY)
     
     def evaluate_sandbox_scenario(self, trains: List[Train], 
                                  segments: List[Dict]) -> Dict:
         """Evaluate a sandbox scenario and return metrics"""
         
         # Calculate metrics
-        total_delay = sum(train.delayMinutes for train in trains)
-        affected_trains = sum(1 for train in trains if train.delayMinutes > 0)
-        affected_passengers = sum(
-            train.passengers or 0 for train in trains if train.delayMinutes > 0
+        delays, passengers, _ = _to_arrays(trains)
+        total_delay, affected_trains, affected_passengers, efficiency = _scenario_metrics(
+            delays, passengers
         )
         
         # Estimate conflicts (simplified)
         conflicts_resolved = max(0, len(trains) - affected_trains - 2)
         
-        # Calculate efficiency score
-        max_possible_delay = len(trains) * 30  # Assume max 30 min delay per train
-        efficiency = max(0, 100 - (total_delay / max_possible_delay * 100)) if max_possible_delay > 0 else 100
-        
         # Generate recommendations
         recommendations = []
         if total_delay > 60:
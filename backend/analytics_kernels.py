@@ -0,0 +1,30 @@
+import numpy as np
+from numba import njit
+
+@njit(cache=True)
+def _scenario_metrics(delays, passengers):
+    """Reduce per-train delay and passenger columns to sandbox scenario metrics"""
+    n = delays.shape[0]
+    total_delay = 0
+    affected_trains = 0
+    affected_passengers = 0
+    
+    for i in range(n):
+        delay = delays[i]
+        total_delay += delay
+        if delay > 0:
+            affected_trains += 1
+            affected_passengers += passengers[i]
+    
+    # Calculate efficiency score
+    max_possible_delay = n * 30  # Assume max 30 min delay per train
+    efficiency = 100.0
+    if max_possible_delay > 0:
+        efficiency = max(0.0, 100.0 - (total_delay / max_possible_delay * 100.0))
+    
+    return total_delay, affected_trains, affected_passengers, efficiency
+
+def warmup():
+    """Compile the kernels ahead of the first request"""
+    dummy = np.zeros(1, dtype=np.int32)
+    _scenario_metrics(dummy, dummy)
@@ -0,0 +1,89 @@
+import asyncio
+import orjson
+from collections import defaultdict
+from typing import Any, Dict
+from fastapi import WebSocket
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Broadcaster:
+    def __init__(self, queue_size: int = 16, send_timeout: float = 5.0):
+        self.queue_size = queue_size
+        self.send_timeout = send_timeout
+        # channel -> {subscriber queue: whether it wants {"stream", "data"} envelopes}
+        self._subscribers: Dict[str, Dict[asyncio.Queue, bool]] = defaultdict(dict)
+        # channel -> set while the channel has at least one subscriber
+        self._active: Dict[str, asyncio.Event] = defaultdict(asyncio.Event)
+        # channel -> last published message, replayed to new subscribers
+        self._last: Dict[str, Any] = {}
+    
+    @staticmethod
+    def _encode(channel: str, message: Any, envelope: bool) -> str:
+        """Serialize a message, wrapped in a {"stream", "data"} envelope if requested"""
+        if envelope:
+            return orjson.dumps({"stream": channel, "data": message}).decode()
+        return orjson.dumps(message).decode()
+    
+    def subscribe(self, *channels: str, envelope: bool = False) -> asyncio.Queue:
+        """Register a new subscriber queue on one or more channels"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        for channel in channels:
+            self._subscribers[channel][queue] = envelope
+            self._active[channel].set()
+            # Start the subscriber off with the latest update instead of
+            # making it wait for the producer's next tick
+            if channel in self._last:
+                queue.put_nowait(self._encode(channel, self._last[channel], envelope))
+        return queue
+    
+    def unsubscribe(self, queue: asyncio.Queue, *channels: str):
+        """Remove a subscriber queue from its channels"""
+        for channel in channels:
+            self._subscribers[channel].pop(queue, None)
+            if not self._subscribers[channel]:
+                self._active[channel].clear()
+    
+    async def wait_for_subscribers(self, channel: str):
+        """Wait until a channel has at least one subscriber"""
+        await self._active[channel].wait()
+    
+    def publish(self, channel: str, message: Any):
+        """Serialize a message once and queue it for every subscriber of a channel"""
+        self._last[channel] = message
+        subscribers = self._subscribers.get(channel)
+        if not subscribers:
+            return
+        
+        # Encoded at most once per form, however many subscribers share it
+        encoded = {}
+        for queue, envelope in subscribers.items():
+            item = encoded.get(envelope)
+            if item is None:
+                item = encoded[envelope] = self._encode(channel, message, envelope)
+            
+            try:
+                queue.put_nowait(item)
+            except asyncio.QueueFull:
+                # Subscriber is falling behind - drop the update instead of blocking everyone
+                logger.warning(f"Dropping {channel} update for slow subscriber")
+    
+    async def forward(self, websocket: WebSocket, *channels: str, envelope: bool = False):
+        """Send every message published on the channels to a websocket until it goes away"""
+        queue = self.subscribe(*channels, envelope=envelope)
+        try:
+            while True:
+                item = await queue.get()
+                await asyncio.wait_for(websocket.send_text(item), self.send_timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Disconnecting slow {'/'.join(channels)} subscriber")
+            # 1013 "Try Again Later" tells the client this was a deliberate close
+            try:
+                await asyncio.wait_for(websocket.close(code=1013), self.send_timeout)
+            except Exception as e:
+                logger.warning(f"Error closing slow subscriber: {e}")
+        finally:
+            self.unsubscribe(queue, *channels)
+
+# Global broadcaster instance
+broadcaster = Broadcaster()
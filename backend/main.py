@@ -1,23 +1,30 @@
 # backend/main.py
-from fastapi import FastAPI, WebSocket
+from fastapi import FastAPI, WebSocket, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import HTTPException
-from typing import Optional
+from fastapi.responses import ORJSONResponse
+from pydantic import TypeAdapter
+from typing import Optional, List, Dict
 import asyncio
-import random
-import json
+import hashlib
+import threading
+import uuid
+import numpy as np
+import pandas as pd
 from models import *
-from ml_models import delay_model
-from optimization import schedule_optimizer
+from ml_models import get_delay_model
+from optimization import get_schedule_optimizer
 from reinforcement_learning import rl_system
 from analytics import analytics_engine
+import analytics_kernels
+from broadcast import broadcaster
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# Serialize REST responses with orjson instead of the stdlib json encoder
+app = FastAPI(default_response_class=ORJSONResponse)
 
 # Enable CORS (so React frontend can call this API)
 app.add_middleware(
@@ -28,6 +35,9 @@ app.add_middleware(
 )
 
 # ---- Mock Data ----
+# Bumped whenever mockTrains changes so cached analytics are invalidated
+_mock_version = 0
+
 ai_decisions_data = [
     {
         "id": "dec-1",
@@ -58,6 +68,20 @@ ai_decisions_data = [
     }
 ]
 
+# Index over ai_decisions_data for constant-time lookups by decision id
+ai_decisions_by_id = {decision["id"]: decision for decision in ai_decisions_data}
+
+def _register_decision(decision: Dict):
+    """Add a decision to ai_decisions_data, replacing any decision with the same id"""
+    # The old entry is swapped out rather than updated, since the RL history
+    # keeps a reference to it as the context of past accept/reject feedback
+    existing = ai_decisions_by_id.get(decision["id"])
+    if existing is not None:
+        ai_decisions_data[ai_decisions_data.index(existing)] = decision
+    else:
+        ai_decisions_data.append(decision)
+    ai_decisions_by_id[decision["id"]] = decision
+
 ml_predictions_data = [
     {
         "trainId": "EXP-101",
@@ -82,6 +106,73 @@ ml_predictions_data = [
     }
 ]
 
+mockTrains = [
+    {
+        "id": "12951",
+        "name": "Mumbai Rajdhani Express",
+        "type": "express",
+        "status": "on-time",
+        "currentLocation": "New Delhi",
+        "destination": "Mumbai Central",
+        "scheduledTime": "14:30",
+        "actualTime": "14:30",
+        "delayMinutes": 0,
+        "priority": 10,
+        "position": [28.6139, 77.2090],
+        "speed": 85.75,
+        "passengers": 342
+    },
+    {
+        "id": "16031",
+        "name": "Andaman Express",
+        "type": "express",
+        "status": "delayed",
+        "currentLocation": "Ghaziabad Junction",
+        "destination": "Chennai Central",
+        "scheduledTime": "14:15",
+        "actualTime": "14:27",
+        "delayMinutes": 12,
+        "priority": 8,
+        "position": [28.6692, 77.4538],
+        "speed": 72.30,
+        "passengers": 284
+    },
+    {
+        "id": "14553",
+        "name": "Himachal Express",
+        "type": "local",
+        "status": "critical",
+        "currentLocation": "Kalka",
+        "destination": "Joginder Nagar",
+        "scheduledTime": "14:20",
+        "actualTime": "14:45",
+        "delayMinutes": 25,
+        "priority": 7,
+        "position": [30.8397, 76.9327],
+        "speed": 0.00,
+        "passengers": 156
+    }
+]
+
+def _build_search_index(trains: List[Dict]) -> pd.Series:
+    """Build a column of lowercased location/destination/name strings for area search"""
+    train_df = pd.DataFrame(trains, columns=["currentLocation", "destination", "name"])
+    return (
+        train_df["currentLocation"] + "|" + train_df["destination"] + "|" + train_df["name"]
+    ).str.lower()
+
+# Validated once at import so analytics requests don't rebuild Train objects
+mock_train_objects = [Train(**train) for train in mockTrains]
+mock_trains_search = _build_search_index(mockTrains)
+
+def set_mock_trains(trains: List[Dict]):
+    """Replace the mock train data and invalidate derived caches"""
+    global mockTrains, mock_train_objects, mock_trains_search, _mock_version
+    mockTrains = trains
+    mock_train_objects = [Train(**train) for train in trains]
+    mock_trains_search = _build_search_index(trains)
+    _mock_version += 1
+
 
 # ---- API Endpoints ----
 @app.get("/")
@@ -103,52 +194,84 @@ def get_predictions():
 
 # ---- New ML & Optimization Endpoints ----
 
-@app.post("/predict")
+# Response validators/serializers built once instead of introspected per request
+_prediction_adapter = TypeAdapter(PredictionResponse)
+_prediction_list_adapter = TypeAdapter(List[PredictionResponse])
+_optimization_adapter = TypeAdapter(OptimizationResponse)
+
+def _prediction_train_data(request: PredictionRequest) -> Dict:
+    """Convert a prediction request into the model's train data dict"""
+    return {
+        "trainId": request.trainId,
+        "currentLocation": request.currentLocation,
+        "destination": request.destination,
+        "scheduledTime": request.scheduledTime,
+        "weatherConditions": request.weatherConditions,
+        "trafficDensity": request.trafficDensity,
+        "historicalDelays": request.historicalDelays or []
+    }
+
+def _prediction_response(train_id: str, delay: float, confidence: float, factors: List[str]) -> Dict:
+    """Build a prediction response, with a recommendation based on the predicted delay"""
+    if delay < 5:
+        recommendation = "Maintain current schedule"
+    elif delay < 15:
+        recommendation = "Monitor closely, minor adjustments may be needed"
+    else:
+        recommendation = "Consider rerouting or priority adjustment"
+    
+    return dict(
+        trainId=train_id,
+        predictedDelay=round(delay, 1),
+        confidence=round(confidence, 2),
+        factors=factors,
+        recommendation=recommendation
+    )
+
+@app.post("/predict", response_model=PredictionResponse)
 async def predict_delay(request: PredictionRequest):
     """Predict train delay using ML model"""
     try:
-        train_data = {
-            "trainId": request.trainId,
-            "currentLocation": request.currentLocation,
-            "destination": request.destination,
-            "scheduledTime": request.scheduledTime,
-            "weatherConditions": request.weatherConditions,
-            "trafficDensity": request.trafficDensity,
-            "historicalDelays": request.historicalDelays or []
-        }
-        
-        delay, confidence, factors = delay_model.predict(train_data)
-        
-        # Generate recommendation based on prediction
-        if delay < 5:
-            recommendation = "Maintain current schedule"
-        elif delay < 15:
-            recommendation = "Monitor closely, minor adjustments may be needed"
-        else:
-            recommendation = "Consider rerouting or priority adjustment"
+        # Loading the model may wait on the startup thread, so keep it off the event loop
+        delay_model = await asyncio.to_thread(get_delay_model)
+        delay, confidence, factors = delay_model.predict(_prediction_train_data(request))
         
-        return PredictionResponse(
-            trainId=request.trainId,
-            predictedDelay=round(delay, 1),
-            confidence=round(confidence, 2),
-            factors=factors,
-            recommendation=recommendation
+        prediction = _prediction_adapter.validate_python(
+            _prediction_response(request.trainId, delay, confidence, factors)
         )
+        return Response(_prediction_adapter.dump_json(prediction), media_type="application/json")
     except Exception as e:
         logger.error(f"Prediction error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/optimize")
+@app.post("/predict/batch", response_model=List[PredictionResponse])
+async def predict_delays(requests: List[PredictionRequest]):
+    """Predict delays for several trains with a single ML model call"""
+    try:
+        delay_model = await asyncio.to_thread(get_delay_model)
+        results = delay_model.predict_batch([_prediction_train_data(r) for r in requests])
+        
+        predictions = _prediction_list_adapter.validate_python([
+            _prediction_response(request.trainId, delay, confidence, factors)
+            for request, (delay, confidence, factors) in zip(requests, results)
+        ])
+        return Response(_prediction_list_adapter.dump_json(predictions), media_type="application/json")
+    except Exception as e:
+        logger.error(f"Batch prediction error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/optimize", response_model=OptimizationResponse)
 async def optimize_schedule(request: OptimizationRequest):
     """Optimize train schedules using constraint programming"""
     try:
-        result = schedule_optimizer.optimize_schedule(
+        result = get_schedule_optimizer().optimize_schedule(
             request.trains, 
             request.segments, 
             request.timeHorizon
         )
         
-        return OptimizationResponse(**result)
+        optimization = _optimization_adapter.validate_python(result)
+        return Response(_optimization_adapter.dump_json(optimization), media_type="application/json")
     except Exception as e:
         logger.error(f"Optimization error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -159,12 +282,7 @@ async def optimize_schedule(request: OptimizationRequest):
 async def accept_decision(decision_id: str, controller_id: Optional[str] = None):
     """Accept an AI decision"""
     try:
-        # Find the decision context (simplified)
-        decision_context = None
-        for decision in ai_decisions_data:
-            if decision["id"] == decision_id:
-                decision_context = decision
-                break
+        decision_context = ai_decisions_by_id.get(decision_id)
         
         rl_system.record_decision(
             decision_id=decision_id,
@@ -174,10 +292,8 @@ async def accept_decision(decision_id: str, controller_id: Optional[str] = None)
         )
         
         # Update decision status
-        for decision in ai_decisions_data:
-            if decision["id"] == decision_id:
-                decision["status"] = "accepted"
-                break
+        if decision_context is not None:
+            decision_context["status"] = "accepted"
         
         return {"status": "success", "message": "Decision accepted"}
     except Exception as e:
@@ -189,12 +305,7 @@ async def reject_decision(decision_id: str, reason: RejectionReason,
                          controller_id: Optional[str] = None):
     """Reject an AI decision with reason"""
     try:
-        # Find the decision context
-        decision_context = None
-        for decision in ai_decisions_data:
-            if decision["id"] == decision_id:
-                decision_context = decision
-                break
+        decision_context = ai_decisions_by_id.get(decision_id)
         
         rl_system.record_decision(
             decision_id=decision_id,
@@ -205,10 +316,8 @@ async def reject_decision(decision_id: str, reason: RejectionReason,
         )
         
         # Update decision status
-        for decision in ai_decisions_data:
-            if decision["id"] == decision_id:
-                decision["status"] = "rejected"
-                break
+        if decision_context is not None:
+            decision_context["status"] = "rejected"
         
         return {"status": "success", "message": f"Decision rejected: {reason.value}"}
     except Exception as e:
@@ -241,15 +350,41 @@ async def evaluate_sandbox(request: SandboxEvaluationRequest):
         logger.error(f"Sandbox evaluation error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Latest analytics response, keyed on the data versions it was computed from
+_metrics_cache: Dict[tuple, PerformanceAnalytics] = {}
+
+# The data versions restart at 0 in every process while the RL history is
+# reloaded from disk, so ETags are salted per process to stay unique
+_etag_salt = uuid.uuid4().hex
+
+def _cached_metrics(mock_version: int, rl_version: int, sandbox_version: int) -> PerformanceAnalytics:
+    """Compute performance analytics once per combination of data versions"""
+    key = (mock_version, rl_version, sandbox_version)
+    cached = _metrics_cache.get(key)
+    if cached is None:
+        metrics = analytics_engine.calculate_performance_metrics(mock_train_objects)
+        cached = PerformanceAnalytics(**metrics)
+        _metrics_cache.clear()
+        _metrics_cache[key] = cached
+    
+    return cached
+
 @app.get("/analytics/performance")
-async def get_performance_analytics():
+async def get_performance_analytics(request: Request, response: Response):
     """Get performance analytics and metrics"""
     try:
-        # Convert mock trains to Train objects for analysis
-        trains = [Train(**train) for train in mockTrains]
-        metrics = analytics_engine.calculate_performance_metrics(trains)
+        # The ETag changes exactly when the cache key does, so unchanged data
+        # can be answered with a 304 without touching the analytics at all
+        versions = (_mock_version, rl_system.version, analytics_engine.version)
+        etag = '"%s"' % hashlib.blake2b(
+            ":".join(map(str, (_etag_salt, *versions))).encode(), digest_size=8
+        ).hexdigest()
         
-        return PerformanceAnalytics(**metrics)
+        if etag in request.headers.get("if-none-match", ""):
+            return Response(status_code=304, headers={"ETag": etag})
+        
+        response.headers["ETag"] = etag
+        return _cached_metrics(*versions)
     except Exception as e:
         logger.error(f"Analytics error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -265,15 +400,8 @@ async def get_trains_by_area(area: Optional[str] = None):
         if area:
             # Filter trains by area (simplified matching)
             area_lower = area.lower()
-            filtered_trains = []
-            
-            for train in trains:
-                if (area_lower in train["currentLocation"].lower() or 
-                    area_lower in train["destination"].lower() or
-                    area_lower in train["name"].lower()):
-                    filtered_trains.append(train)
-            
-            trains = filtered_trains
+            mask = mock_trains_search.str.contains(area_lower, regex=False).to_numpy()
+            trains = [trains[i] for i in np.flatnonzero(mask)]
         
         return {
             "trains": trains,
@@ -284,124 +412,147 @@ async def get_trains_by_area(area: Optional[str] = None):
         logger.error(f"Area filter error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
-# ---- Mock Data (Updated) ----
-mockTrains = [
-    {
-        "id": "12951",
-        "name": "Mumbai Rajdhani Express",
-        "type": "express",
-        "status": "on-time",
-        "currentLocation": "New Delhi",
-        "destination": "Mumbai Central",
-        "scheduledTime": "14:30",
-        "actualTime": "14:30",
-        "delayMinutes": 0,
-        "priority": 10,
-        "position": [28.6139, 77.2090],
-        "speed": 85.75,
-        "passengers": 342
-    },
-    {
-        "id": "16031",
-        "name": "Andaman Express",
-        "type": "express",
-        "status": "delayed",
-        "currentLocation": "Ghaziabad Junction",
-        "destination": "Chennai Central",
-        "scheduledTime": "14:15",
-        "actualTime": "14:27",
-        "delayMinutes": 12,
-        "priority": 8,
-        "position": [28.6692, 77.4538],
-        "speed": 72.30,
-        "passengers": 284
-    },
-    {
-        "id": "14553",
-        "name": "Himachal Express",
-        "type": "local",
-        "status": "critical",
-        "currentLocation": "Kalka",
-        "destination": "Joginder Nagar",
-        "scheduledTime": "14:20",
-        "actualTime": "14:45",
-        "delayMinutes": 25,
-        "priority": 7,
-        "position": [30.8397, 76.9327],
-        "speed": 0.00,
-        "passengers": 156
-    }
-]
+# ---- Real-Time Update Producers ----
+# Each producer synthesizes one update per tick and publishes it to every
+# subscribed websocket, so generation and JSON encoding don't scale with clients
 
-# ---- WebSocket for Real-Time Train Updates ----
-@app.websocket("/ws/trains")
-async def websocket_endpoint(websocket: WebSocket):
-    await websocket.accept()
+# Constant choices for the simulated updates, built once rather than per tick
+UPDATE_TRAIN_NAMES = ("Express 101", "Passenger 202", "Freight 303")
+UPDATE_TRAIN_STATUSES = ("On Time", "Delayed", "Rerouted")
+PREDICTION_TRAIN_IDS = ("EXP-101", "FRT-203", "LOC-78")
+FACTOR_CHOICES = (
+    ("Weather conditions", "Traffic density"),
+    ("Signal delay", "Track congestion"),
+    ("Mechanical issue", "Platform availability")
+)
+RECOMMENDATION_CHOICES = (
+    "Maintain current schedule",
+    "Reroute via alternate track",
+    "Emergency maintenance required"
+)
+DECISION_TYPES = ("priority", "routing", "scheduling")
+
+class _RandomPool:
+    """Uniform draws generated in PCG64 batches and handed out one per call"""
+    
+    def __init__(self, batch_size: int = 4096):
+        self._rng = np.random.default_rng()
+        self._batch_size = batch_size
+        self._draws = []
+        self._idx = 0
+    
+    def random(self) -> float:
+        if self._idx >= len(self._draws):
+            # Convert the whole batch to Python floats once instead of per draw
+            self._draws = self._rng.random(self._batch_size).tolist()
+            self._idx = 0
+        value = self._draws[self._idx]
+        self._idx += 1
+        return value
+    
+    def randint(self, low: int, high: int) -> int:
+        """Random integer in [low, high], matching random.randint"""
+        return low + int(self.random() * (high - low + 1))
+    
+    def uniform(self, low: float, high: float) -> float:
+        return low + (high - low) * self.random()
+    
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+# Shared by all producers so draws come from a single batched generator
+_random_pool = _RandomPool()
+
+async def _produce_train_updates():
     while True:
+        await broadcaster.wait_for_subscribers("trains")
         # Simulate random train update
         update = {
-            "train": random.choice(["Express 101", "Passenger 202", "Freight 303"]),
-            "status": random.choice(["On Time", "Delayed", "Rerouted"]),
-            "delay": random.randint(0, 15),
+            "train": _random_pool.choice(UPDATE_TRAIN_NAMES),
+            "status": _random_pool.choice(UPDATE_TRAIN_STATUSES),
+            "delay": _random_pool.randint(0, 15),
         }
-        await websocket.send_json(update)
+        broadcaster.publish("trains", update)
         await asyncio.sleep(3)  # send every 3 sec
 
-# WebSocket for ML Predictions Updates
-@app.websocket("/ws/predictions")
-async def websocket_predictions(websocket: WebSocket):
-    await websocket.accept()
+async def _produce_prediction_updates():
     while True:
+        await broadcaster.wait_for_subscribers("predictions")
         # Simulate prediction updates
-        train_ids = ["EXP-101", "FRT-203", "LOC-78"]
-        train_id = random.choice(train_ids)
-        
         update = {
-            "trainId": train_id,
-            "predictedDelay": random.randint(0, 30),
-            "confidence": round(random.uniform(0.7, 0.98), 2),
-            "factors": random.choice([
-                ["Weather conditions", "Traffic density"],
-                ["Signal delay", "Track congestion"],
-                ["Mechanical issue", "Platform availability"]
-            ]),
-            "recommendation": random.choice([
-                "Maintain current schedule",
-                "Reroute via alternate track",
-                "Emergency maintenance required"
-            ])
+            "trainId": _random_pool.choice(PREDICTION_TRAIN_IDS),
+            "predictedDelay": _random_pool.randint(0, 30),
+            "confidence": round(_random_pool.uniform(0.7, 0.98), 2),
+            "factors": _random_pool.choice(FACTOR_CHOICES),
+            "recommendation": _random_pool.choice(RECOMMENDATION_CHOICES)
         }
-        await websocket.send_json(update)
+        broadcaster.publish("predictions", update)
         await asyncio.sleep(5)  # send every 5 sec
 
-# WebSocket for AI Decisions Updates  
-@app.websocket("/ws/decisions")
-async def websocket_decisions(websocket: WebSocket):
-    await websocket.accept()
+async def _produce_decision_updates():
     while True:
+        await broadcaster.wait_for_subscribers("decisions")
         # Simulate new AI decisions
-        decision_types = ["priority", "routing", "scheduling"]
-        decision_type = random.choice(decision_types)
+        decision_type = _random_pool.choice(DECISION_TYPES)
         
         update = {
-            "id": f"dec-{random.randint(100, 999)}",
+            "id": f"dec-{_random_pool.randint(100, 999)}",
             "type": decision_type,
             "description": f"New {decision_type} decision for train optimization",
-            "impact": f"Estimated time saving: {random.randint(5, 20)} minutes",
-            "confidence": round(random.uniform(0.75, 0.95), 2),
+            "impact": f"Estimated time saving: {_random_pool.randint(5, 20)} minutes",
+            "confidence": round(_random_pool.uniform(0.75, 0.95), 2),
             "status": "pending",
-            "estimatedTimeSaving": random.randint(5, 20)
+            "estimatedTimeSaving": _random_pool.randint(5, 20)
         }
-        await websocket.send_json(update)
+        _register_decision(update)
+        broadcaster.publish("decisions", update)
         await asyncio.sleep(8)  # send every 8 sec
 
-# Initialize ML model on startup
-@app.on_event("startup")
-async def startup_event():
-    logger.info("Initializing ML models...")
+# Keep references so the producer tasks aren't garbage collected
+_producer_tasks = []
+
+# ---- WebSocket for Real-Time Train Updates ----
+@app.websocket("/ws/trains")
+async def websocket_endpoint(websocket: WebSocket):
+    await websocket.accept()
+    await broadcaster.forward(websocket, "trains")
+
+# WebSocket for ML Predictions Updates
+@app.websocket("/ws/predictions")
+async def websocket_predictions(websocket: WebSocket):
+    await websocket.accept()
+    await broadcaster.forward(websocket, "predictions")
+
+# WebSocket for AI Decisions Updates  
+@app.websocket("/ws/decisions")
+async def websocket_decisions(websocket: WebSocket):
+    await websocket.accept()
+    await broadcaster.forward(websocket, "decisions")
+
+# Multiplexed WebSocket carrying all three streams over a single connection.
+# Messages are tagged {"stream": "trains" | "predictions" | "decisions", "data": {...}}
+@app.websocket("/ws/stream")
+async def websocket_stream(websocket: WebSocket):
+    await websocket.accept()
+    await broadcaster.forward(websocket, "trains", "predictions", "decisions", envelope=True)
+
+def _initialize_models():
     try:
-        # Train the delay prediction model
-        delay_model.train()
+        get_delay_model()
         logger.info("ML models initialized successfully")
     except Exception as e:
         logger.error(f"Error initializing ML models: {e}")
+
+# Initialize ML model on startup
+@app.on_event("startup")
+async def startup_event():
+    # Compile numeric kernels up front so the first request doesn't pay for it
+    analytics_kernels.warmup()
+    
+    for producer in (_produce_train_updates, _produce_prediction_updates, _produce_decision_updates):
+        _producer_tasks.append(asyncio.create_task(producer()))
+    
+    # Load or train the delay prediction model in the background so startup
+    # isn't blocked and it is usually ready before the first prediction request
+    logger.info("Initializing ML models...")
+    threading.Thread(target=_initialize_models, daemon=True).start()
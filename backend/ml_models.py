@@ -1,116 +1,188 @@
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import GradientBoostingRegressor
-from sklearn.preprocessing import StandardScaler, LabelEncoder
+from sklearn.ensemble import HistGradientBoostingRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_absolute_error, r2_score
 import joblib
 import os
+from numba import njit
+from functools import lru_cache
 from typing import List, Dict, Tuple
+import threading
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Weather factors (clear, rain, fog, snow)
+WEATHER_MULTIPLIERS = np.array([1.0, 1.5, 2.0, 2.5])
+
+@njit(cache=True)
+def _gen_delays(hour, train_type_idx, weather_idx, traffic_density, historical_avg_delay,
+                priority, rush_delay, freight_delay, local_delay, noise):
+    """Compute synthetic delays row by row from pre-drawn random components"""
+    n = hour.shape[0]
+    delay = np.empty(n)
+    
+    for i in range(n):
+        base_delay = 0.0
+        
+        # Time-based factors
+        h = hour[i]
+        if 7 <= h <= 9 or 17 <= h <= 19:  # Rush hours
+            base_delay += rush_delay[i]
+        
+        # Train type factors (express, freight, local)
+        if train_type_idx[i] == 1:
+            base_delay += freight_delay[i]
+        elif train_type_idx[i] == 2:
+            base_delay += local_delay[i]
+        
+        base_delay *= WEATHER_MULTIPLIERS[weather_idx[i]]
+        
+        # Traffic and historical factors
+        base_delay += traffic_density[i] * 10
+        base_delay += historical_avg_delay[i] * 0.3
+        
+        # Priority adjustment
+        base_delay *= (11 - priority[i]) / 10
+        
+        # Add some noise
+        delay[i] = max(0.0, base_delay + noise[i])
+    
+    return delay
+
+# Bump whenever the features or model layout change so stale caches are retrained
+MODEL_STATE_VERSION = 2
+
 class DelayPredictionModel:
-    def __init__(self):
-        self.model = GradientBoostingRegressor(
-            n_estimators=100,
-            learning_rate=0.1,
-            max_depth=6,
-            random_state=42
-        )
-        self.scaler = StandardScaler()
-        self.label_encoders = {}
-        self.is_trained = False
+    def __init__(self, model_file="delay_model.joblib"):
+        self.model_file = model_file
         self.feature_names = [
             'hour', 'day_of_week', 'train_type_encoded', 'priority',
             'weather_encoded', 'traffic_density', 'historical_avg_delay',
             'distance_km', 'speed_kmh'
         ]
+        # Histogram-based boosting bins features itself, so no scaler is needed,
+        # and the encoded categorical columns are split natively
+        self.model = HistGradientBoostingRegressor(
+            max_iter=100,
+            learning_rate=0.1,
+            max_depth=6,
+            categorical_features=[
+                self.feature_names.index('train_type_encoded'),
+                self.feature_names.index('weather_encoded')
+            ],
+            random_state=42
+        )
+        # Fixed category sets, so encoding needs no fitting and codes are stable
+        self._type_dtype = pd.CategoricalDtype(['express', 'freight', 'local'])
+        self._weather_dtype = pd.CategoricalDtype(['clear', 'rain', 'fog', 'snow'])
+        self._type_map = self._category_map(self._type_dtype)
+        self._weather_map = self._category_map(self._weather_dtype)
+        self.is_trained = False
+        # Per-instance so the cache can be cleared whenever the model changes
+        self._predict_cached = lru_cache(maxsize=4096)(self._predict_core)
+        self._load_state()
+        
+    def _load_state(self):
+        """Restore a previously trained model from disk, if one is cached"""
+        if not os.path.exists(self.model_file):
+            return
+        try:
+            version, model = joblib.load(self.model_file)
+        except Exception as e:
+            logger.error(f"Error loading cached model: {e}")
+            return
+        if version != MODEL_STATE_VERSION:
+            logger.info("Cached model is out of date, it will be retrained")
+            return
         
+        self.model = model
+        self.is_trained = True
+        logger.info(f"Loaded trained model from {self.model_file}")
+    
+    def _save_state(self):
+        """Cache the trained model on disk for the next cold start"""
+        try:
+            joblib.dump(
+                (MODEL_STATE_VERSION, self.model),
+                self.model_file, compress=3
+            )
+        except Exception as e:
+            logger.error(f"Error saving model: {e}")
+    
     def _generate_synthetic_data(self, n_samples=10000):
         """Generate synthetic training data for the delay prediction model"""
-        np.random.seed(42)
-        
-        data = []
-        for _ in range(n_samples):
-            # Time features
-            hour = np.random.randint(0, 24)
-            day_of_week = np.random.randint(0, 7)
-            
-            # Train features
-            train_type = np.random.choice(['express', 'freight', 'local'])
-            priority = np.random.randint(1, 11)
-            
-            # Environmental features
-            weather = np.random.choice(['clear', 'rain', 'fog', 'snow'])
-            traffic_density = np.random.uniform(0, 1)
-            
-            # Historical data
-            historical_avg_delay = np.random.exponential(5)
-            
-            # Route features
-            distance_km = np.random.uniform(10, 500)
-            speed_kmh = np.random.uniform(40, 120)
-            
-            # Calculate delay based on realistic factors
-            base_delay = 0
-            
-            # Time-based factors
-            if 7 <= hour <= 9 or 17 <= hour <= 19:  # Rush hours
-                base_delay += np.random.exponential(8)
-            
-            # Train type factors
-            if train_type == 'freight':
-                base_delay += np.random.exponential(12)
-            elif train_type == 'local':
-                base_delay += np.random.exponential(6)
-            
-            # Weather factors
-            weather_multiplier = {
-                'clear': 1.0, 'rain': 1.5, 'fog': 2.0, 'snow': 2.5
-            }
-            base_delay *= weather_multiplier[weather]
-            
-            # Traffic and historical factors
-            base_delay += traffic_density * 10
-            base_delay += historical_avg_delay * 0.3
-            
-            # Priority adjustment
-            base_delay *= (11 - priority) / 10
-            
-            # Add some noise
-            delay = max(0, base_delay + np.random.normal(0, 2))
-            
-            data.append({
-                'hour': hour,
-                'day_of_week': day_of_week,
-                'train_type': train_type,
-                'priority': priority,
-                'weather': weather,
-                'traffic_density': traffic_density,
-                'historical_avg_delay': historical_avg_delay,
-                'distance_km': distance_km,
-                'speed_kmh': speed_kmh,
-                'delay_minutes': delay
-            })
-        
-        return pd.DataFrame(data)
+        rng = np.random.default_rng(42)
+        n = n_samples
+        
+        # Time features
+        hour = rng.integers(0, 24, n)
+        day_of_week = rng.integers(0, 7, n)
+        
+        # Train features
+        train_types = np.array(['express', 'freight', 'local'])
+        train_type_idx = rng.integers(0, 3, n)
+        priority = rng.integers(1, 11, n)
+        
+        # Environmental features
+        weathers = np.array(['clear', 'rain', 'fog', 'snow'])
+        weather_idx = rng.integers(0, 4, n)
+        traffic_density = rng.uniform(0, 1, n)
+        
+        # Historical data
+        historical_avg_delay = rng.exponential(5, n)
+        
+        # Route features
+        distance_km = rng.uniform(10, 500, n)
+        speed_kmh = rng.uniform(40, 120, n)
+        
+        # Random components of the delay, drawn up front so they come from the
+        # seeded generator in a fixed order rather than from Numba's own RNG
+        rush_delay = rng.exponential(8, n)
+        freight_delay = rng.exponential(12, n)
+        local_delay = rng.exponential(6, n)
+        noise = rng.normal(0, 2, n)
+        
+        # Calculate delay based on realistic factors
+        delay = _gen_delays(
+            hour, train_type_idx, weather_idx, traffic_density, historical_avg_delay,
+            priority, rush_delay, freight_delay, local_delay, noise
+        )
+        
+        return pd.DataFrame({
+            'hour': hour,
+            'day_of_week': day_of_week,
+            'train_type': train_types[train_type_idx],
+            'priority': priority,
+            'weather': weathers[weather_idx],
+            'traffic_density': traffic_density,
+            'historical_avg_delay': historical_avg_delay,
+            'distance_km': distance_km,
+            'speed_kmh': speed_kmh,
+            'delay_minutes': delay
+        })
     
     def _prepare_features(self, df):
         """Prepare features for training/prediction"""
         # Encode categorical variables
-        for col in ['train_type', 'weather']:
-            if col not in self.label_encoders:
-                self.label_encoders[col] = LabelEncoder()
-                df[f'{col}_encoded'] = self.label_encoders[col].fit_transform(df[col])
-            else:
-                df[f'{col}_encoded'] = self.label_encoders[col].transform(df[col])
+        df['train_type_encoded'] = df['train_type'].astype(self._type_dtype).cat.codes
+        df['weather_encoded'] = df['weather'].astype(self._weather_dtype).cat.codes
         
         # Select features
         X = df[self.feature_names].copy()
         return X
     
+    @staticmethod
+    def _category_map(dtype: pd.CategoricalDtype) -> Dict[str, int]:
+        """Map each category of a categorical dtype to its code"""
+        return {c: i for i, c in enumerate(dtype.categories)}
+    
+    def train_or_load(self):
+        """Make sure the model is ready, training only if no cached model was loaded"""
+        if not self.is_trained:
+            self.train()
+    
     def train(self):
         """Train the delay prediction model"""
         logger.info("Generating synthetic training data...")
@@ -125,67 +197,133 @@ class DelayPredictionModel:
             X, y, test_size=0.2, random_state=42
         )
         
-        # Scale features
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        X_test_scaled = self.scaler.transform(X_test)
-        
-        # Train model
+        # Train model (on plain arrays, matching the rows built in predict)
         logger.info("Training gradient boosting model...")
-        self.model.fit(X_train_scaled, y_train)
+        self.model.fit(X_train.to_numpy(), y_train)
         
         # Evaluate
-        y_pred = self.model.predict(X_test_scaled)
+        y_pred = self.model.predict(X_test.to_numpy())
         mae = mean_absolute_error(y_test, y_pred)
         r2 = r2_score(y_test, y_pred)
         
         logger.info(f"Model trained - MAE: {mae:.2f}, R2: {r2:.3f}")
         self.is_trained = True
+        self._predict_cached.cache_clear()
+        self._save_state()
         
         return {"mae": mae, "r2": r2}
     
+    def _extract_inputs(self, train_data: Dict) -> Tuple[int, str, int, str, float, float]:
+        """Pull the raw model inputs out of a train data dict"""
+        # An empty history falls back to the default too; averaging it would give NaN
+        historical_delays = train_data.get('historicalDelays') or [5]
+        return (
+            int(train_data.get('scheduledTime', '14:30').split(':')[0]),
+            train_data.get('type', 'local'),
+            train_data.get('priority', 5),
+            train_data.get('weatherConditions', 'clear'),
+            train_data.get('trafficDensity', 0.5),
+            sum(historical_delays) / len(historical_delays)
+        )
+    
+    def _fill_row(self, row: np.ndarray, hour: int, train_type: str, priority: int, weather: str,
+                  traffic_density: float, historical_avg_delay: float):
+        """Write one feature row in self.feature_names order"""
+        row[0] = hour
+        row[1] = 1  # Default to Monday
+        # Unknown categories are left missing rather than borrowing a real category's code
+        row[2] = self._type_map.get(train_type, np.nan)
+        row[3] = priority
+        row[4] = self._weather_map.get(weather, np.nan)
+        row[5] = traffic_density
+        row[6] = historical_avg_delay
+        row[7] = 100  # Default distance
+        row[8] = 80   # Default speed
+    
+    @staticmethod
+    def _factors(hour: int, train_type: str, priority: int, weather: str,
+                 traffic_density: float, historical_avg_delay: float) -> List[str]:
+        """Explain which inputs are driving the predicted delay"""
+        factors = []
+        if weather != 'clear':
+            factors.append(f"Weather conditions: {weather}")
+        if traffic_density > 0.7:
+            factors.append("High traffic density")
+        if historical_avg_delay > 10:
+            factors.append("Historical delays in this route")
+        if priority < 5:
+            factors.append("Low priority train")
+        
+        if not factors:
+            factors = ["Normal operating conditions"]
+        
+        return factors
+    
+    def _predict_core(self, hour: int, train_type: str, priority: int, weather: str,
+                      traffic_density: float, historical_avg_delay: float) -> Tuple[float, float]:
+        """Run the model on a single feature row, returning (delay, confidence)"""
+        X = np.empty((1, len(self.feature_names)), dtype=np.float64)
+        self._fill_row(X[0], hour, train_type, priority, weather,
+                       traffic_density, historical_avg_delay)
+        
+        # Predict
+        delay_pred = self.model.predict(X)[0]
+        
+        # Calculate confidence (simplified)
+        confidence = min(0.95, max(0.6, 1.0 - (delay_pred / 60)))
+        
+        return max(0, delay_pred), confidence
+    
     def predict(self, train_data: Dict) -> Tuple[float, float, List[str]]:
         """Predict delay for a train"""
         if not self.is_trained:
             self.train()
         
-        # Convert input to DataFrame
-        df = pd.DataFrame([{
-            'hour': int(train_data.get('scheduledTime', '14:30').split(':')[0]),
-            'day_of_week': 1,  # Default to Monday
-            'train_type': train_data.get('type', 'local'),
-            'priority': train_data.get('priority', 5),
-            'weather': train_data.get('weatherConditions', 'clear'),
-            'traffic_density': train_data.get('trafficDensity', 0.5),
-            'historical_avg_delay': np.mean(train_data.get('historicalDelays', [5])),
-            'distance_km': 100,  # Default distance
-            'speed_kmh': 80     # Default speed
-        }])
-        
-        # Prepare features
-        X = self._prepare_features(df)
-        X_scaled = self.scaler.transform(X)
+        inputs = self._extract_inputs(train_data)
+        hour, train_type, priority, weather, traffic_density, historical_avg_delay = inputs
         
-        # Predict
-        delay_pred = self.model.predict(X_scaled)[0]
+        # Continuous inputs are bucketed so similar requests share a cache entry
+        delay_pred, confidence = self._predict_cached(
+            hour, train_type, priority, weather,
+            round(traffic_density, 2), round(historical_avg_delay, 1)
+        )
         
-        # Calculate confidence (simplified)
-        confidence = min(0.95, max(0.6, 1.0 - (delay_pred / 60)))
+        return delay_pred, confidence, self._factors(*inputs)
+    
+    def predict_batch(self, train_datas: List[Dict]) -> List[Tuple[float, float, List[str]]]:
+        """Predict delays for many trains with a single model call"""
+        if not self.is_trained:
+            self.train()
+        if not train_datas:
+            return []
         
-        # Generate factors
-        factors = []
-        if df['weather'].iloc[0] != 'clear':
-            factors.append(f"Weather conditions: {df['weather'].iloc[0]}")
-        if df['traffic_density'].iloc[0] > 0.7:
-            factors.append("High traffic density")
-        if df['historical_avg_delay'].iloc[0] > 10:
-            factors.append("Historical delays in this route")
-        if df['priority'].iloc[0] < 5:
-            factors.append("Low priority train")
+        inputs = [self._extract_inputs(train_data) for train_data in train_datas]
+        X = np.empty((len(inputs), len(self.feature_names)), dtype=np.float64)
+        for row, values in zip(X, inputs):
+            self._fill_row(row, *values)
         
-        if not factors:
-            factors = ["Normal operating conditions"]
+        delay_preds = self.model.predict(X)
         
-        return max(0, delay_pred), confidence, factors
+        # Calculate confidence (simplified)
+        confidences = np.clip(1.0 - delay_preds / 60, 0.6, 0.95)
+        delay_preds = np.maximum(delay_preds, 0)
+        
+        return [
+            (float(delay), float(confidence), self._factors(*values))
+            for delay, confidence, values in zip(delay_preds, confidences, inputs)
+        ]
+
+# Global model instance, created lazily by get_delay_model
+_delay_model = None
+_delay_model_lock = threading.Lock()
 
-# Global model instance
-delay_model = DelayPredictionModel()
\ No newline at end of file
+def get_delay_model() -> DelayPredictionModel:
+    """Return the shared delay model, loading or training it on first use"""
+    global _delay_model
+    if _delay_model is None:
+        with _delay_model_lock:
+            if _delay_model is None:
+                model = DelayPredictionModel()
+                model.train_or_load()
+                _delay_model = model
+    return _delay_model
\ No newline at end of file
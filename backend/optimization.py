@@ -1,15 +1,44 @@
 from ortools.sat.python import cp_model
+from collections import defaultdict
+from functools import lru_cache
+from itertools import chain, combinations
 from typing import List, Dict, Tuple
+import os
+import threading
 import numpy as np
 from models import Train, RailwaySegment, OptimizedSchedule
 import logging
 
 logger = logging.getLogger(__name__)
 
+@lru_cache(maxsize=2048)
+def _time_to_minutes(time_str: str) -> int:
+    """Convert HH:MM to minutes since midnight"""
+    # Fast path for zero-padded HH:MM, which is what the frontend sends
+    if len(time_str) == 5 and time_str[2] == ':':
+        try:
+            return int(time_str[:2]) * 60 + int(time_str[3:])
+        except ValueError:
+            pass
+    try:
+        hours, minutes = map(int, time_str.split(':'))
+        return hours * 60 + minutes
+    except:
+        return 14 * 60 + 30  # Default to 14:30
+
+@lru_cache(maxsize=2048)
+def _minutes_to_time(minutes: int) -> str:
+    """Convert minutes since midnight to HH:MM"""
+    hours = minutes // 60
+    mins = minutes % 60
+    return f"{hours:02d}:{mins:02d}"
+
 class ScheduleOptimizer:
     def __init__(self):
         self.model = None
         self.solver = None
+        # Departure minute of each train in the last solved schedule, used as a warm start
+        self._last_solution: Dict[str, int] = {}
         
     def optimize_schedule(self, trains: List[Train], segments: List[RailwaySegment], 
                          time_horizon: int = 120) -> Dict:
@@ -18,80 +47,88 @@ class ScheduleOptimizer:
         """
         logger.info(f"Optimizing schedule for {len(trains)} trains over {time_horizon} minutes")
         
+        if not trains:
+            return self._create_fallback_solution(trains)
+        
         # Create CP model
         model = cp_model.CpModel()
         
         # Time discretization (minutes)
         max_time = time_horizon
         
-        # Variables for each train's departure time
-        departure_times = {}
-        arrival_times = {}
+        # Read each train's fields once into parallel columns indexed by position,
+        # so model building doesn't go back through the Pydantic objects
+        ids, scheduled, travel, locations, destinations = zip(*[
+            (train.id, _time_to_minutes(train.scheduledTime), self._estimate_travel_time(train),
+             train.currentLocation, train.destination)
+            for train in trains
+        ])
         
-        for train in trains:
-            # Parse scheduled time to minutes
-            scheduled_minutes = self._time_to_minutes(train.scheduledTime)
+        # Variables for each train's departure time, indexed by train position.
+        # Names are left empty since they only matter for debugging
+        departure_times = []
+        arrival_times = []
+        
+        for i, train_id in enumerate(ids):
+            scheduled_minutes = scheduled[i]
             
             # Allow departure within ±30 minutes of scheduled time
             min_departure = max(0, scheduled_minutes - 30)
             max_departure = min(max_time, scheduled_minutes + 30)
             
-            departure_times[train.id] = model.NewIntVar(
-                min_departure, max_departure, f'departure_{train.id}'
-            )
+            departure = model.NewIntVar(min_departure, max_departure, '')
+            departure_times.append(departure)
             
-            # Estimate travel time (simplified)
-            travel_time = self._estimate_travel_time(train)
-            arrival_times[train.id] = model.NewIntVar(
+            # Warm start from the previous solution when it is still in range
+            previous = self._last_solution.get(train_id)
+            if previous is not None and min_departure <= previous <= max_departure:
+                model.AddHint(departure, previous)
+            
+            travel_time = travel[i]
+            arrival = model.NewIntVar(
                 min_departure + travel_time, 
                 max_departure + travel_time, 
-                f'arrival_{train.id}'
+                ''
             )
+            arrival_times.append(arrival)
             
             # Constraint: arrival = departure + travel_time
-            model.Add(arrival_times[train.id] == departure_times[train.id] + travel_time)
+            model.Add(arrival == departure + travel_time)
         
         # Conflict avoidance constraints
-        self._add_conflict_constraints(model, trains, segments, departure_times, arrival_times)
+        self._add_conflict_constraints(model, locations, destinations, segments,
+                                       departure_times, arrival_times)
         
-        # Objective: minimize total delay
+        # Objective: minimize total delay. Each train's delay is a non-negative
+        # slack bounded below by its lateness; since the objective pushes slacks
+        # down, this one-sided constraint is equivalent to max(lateness, 0)
         total_delay = []
-        for train in trains:
-            scheduled_minutes = self._time_to_minutes(train.scheduledTime)
-            delay = model.NewIntVar(0, max_time, f'delay_{train.id}')
-            model.AddMaxEquality(delay, [
-                departure_times[train.id] - scheduled_minutes, 0
-            ])
+        for departure, scheduled_minutes in zip(departure_times, scheduled):
+            delay = model.NewIntVar(0, max_time, '')
+            model.Add(delay >= departure - scheduled_minutes)
             total_delay.append(delay)
         
-        model.Minimize(sum(total_delay))
+        model.Minimize(cp_model.LinearExpr.Sum(total_delay))
         
         # Solve
         solver = cp_model.CpSolver()
         solver.parameters.max_time_in_seconds = 30.0
+        # Parallel portfolio search across the available cores
+        solver.parameters.num_workers = min(8, os.cpu_count() or 1)
+        solver.parameters.log_search_progress = False
         
         status = solver.Solve(model)
         
         if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            return self._extract_solution(solver, trains, departure_times, arrival_times)
+            # Replaced rather than merged so hints don't pile up for trains no longer scheduled
+            self._last_solution = {
+                train_id: solver.Value(departure) for train_id, departure in zip(ids, departure_times)
+            }
+            return self._extract_solution(solver, trains, ids, scheduled, departure_times, arrival_times)
         else:
             logger.warning("No feasible solution found, returning original schedule")
             return self._create_fallback_solution(trains)
     
-    def _time_to_minutes(self, time_str: str) -> int:
-        """Convert HH:MM to minutes since midnight"""
-        try:
-            hours, minutes = map(int, time_str.split(':'))
-            return hours * 60 + minutes
-        except:
-            return 14 * 60 + 30  # Default to 14:30
-    
-    def _minutes_to_time(self, minutes: int) -> str:
-        """Convert minutes since midnight to HH:MM"""
-        hours = minutes // 60
-        mins = minutes % 60
-        return f"{hours:02d}:{mins:02d}"
-    
     def _estimate_travel_time(self, train: Train) -> int:
         """Estimate travel time for a train (simplified)"""
         base_time = {
@@ -101,57 +138,62 @@ class ScheduleOptimizer:
         }
         return base_time.get(train.type, 60)
     
-    def _add_conflict_constraints(self, model, trains, segments, departure_times, arrival_times):
+    def _add_conflict_constraints(self, model, locations, destinations, segments,
+                                  departure_times, arrival_times):
         """Add constraints to avoid conflicts between trains"""
-        # Simplified: ensure minimum separation between trains on same route
-        for i, train1 in enumerate(trains):
-            for j, train2 in enumerate(trains[i+1:], i+1):
-                if self._trains_share_route(train1, train2):
-                    # Minimum 10-minute separation
-                    separation = 10
-                    
-                    # Either train1 departs before train2 with separation
-                    # or train2 departs before train1 with separation
-                    b = model.NewBoolVar(f'order_{train1.id}_{train2.id}')
-                    
-                    model.Add(
-                        departure_times[train2.id] >= departure_times[train1.id] + separation
-                    ).OnlyEnforceIf(b)
-                    
-                    model.Add(
-                        departure_times[train1.id] >= departure_times[train2.id] + separation
-                    ).OnlyEnforceIf(b.Not())
-    
-    def _trains_share_route(self, train1: Train, train2: Train) -> bool:
-        """Check if two trains share part of their route (simplified)"""
-        # Simplified logic: trains share route if they have similar locations
-        return (train1.currentLocation == train2.currentLocation or 
-                train1.destination == train2.destination)
+        # Simplified: ensure minimum separation between trains on same route.
+        # Trains share a route when they start or end at the same place, so only
+        # pairs within a location bucket need checking, not every pair of trains
+        by_location = defaultdict(list)
+        by_destination = defaultdict(list)
+        for i, (location, destination) in enumerate(zip(locations, destinations)):
+            by_location[location].append(i)
+            by_destination[destination].append(i)
+        
+        conflicting_pairs = set()
+        for bucket in chain(by_location.values(), by_destination.values()):
+            conflicting_pairs.update(combinations(bucket, 2))
+        
+        for i, j in sorted(conflicting_pairs):
+            # Minimum 10-minute separation
+            separation = 10
+            
+            # Either train1 departs before train2 with separation
+            # or train2 departs before train1 with separation
+            b = model.NewBoolVar('')
+            
+            model.Add(
+                departure_times[j] >= departure_times[i] + separation
+            ).OnlyEnforceIf(b)
+            
+            model.Add(
+                departure_times[i] >= departure_times[j] + separation
+            ).OnlyEnforceIf(b.Not())
     
-    def _extract_solution(self, solver, trains, departure_times, arrival_times):
+    def _extract_solution(self, solver, trains, ids, scheduled, departure_times, arrival_times):
         """Extract optimized solution from solver"""
         optimized_schedules = []
         total_delay_reduction = 0
         conflicts_resolved = 0
         
-        for train in trains:
-            original_minutes = self._time_to_minutes(train.scheduledTime)
-            optimized_minutes = solver.Value(departure_times[train.id])
+        for i, train_id in enumerate(ids):
+            original_minutes = scheduled[i]
+            optimized_minutes = solver.Value(departure_times[i])
             
             delay_change = optimized_minutes - original_minutes
             if delay_change < 0:  # Improvement
                 total_delay_reduction += abs(delay_change)
             
             optimized_schedules.append(OptimizedSchedule(
-                trainId=train.id,
-                originalSchedule=train.scheduledTime,
-                optimizedSchedule=self._minutes_to_time(optimized_minutes),
+                trainId=train_id,
+                originalSchedule=trains[i].scheduledTime,
+                optimizedSchedule=_minutes_to_time(optimized_minutes),
                 estimatedDelay=max(0, delay_change),
                 routeChanges=[]  # Simplified
             ))
         
         # Calculate efficiency
-        efficiency = min(100, max(0, 100 - (total_delay_reduction / len(trains))))
+        efficiency = min(100, max(0, 100 - (total_delay_reduction / len(ids))))
         
         return {
             "optimizedSchedules": optimized_schedules,
@@ -177,5 +219,15 @@ class ScheduleOptimizer:
             "efficiency": 50
         }
 
-# Global optimizer instance
-schedule_optimizer = ScheduleOptimizer()
\ No newline at end of file
+# Global optimizer instance, created lazily by get_schedule_optimizer
+_schedule_optimizer = None
+_schedule_optimizer_lock = threading.Lock()
+
+def get_schedule_optimizer() -> ScheduleOptimizer:
+    """Return the shared schedule optimizer, creating it on first use"""
+    global _schedule_optimizer
+    if _schedule_optimizer is None:
+        with _schedule_optimizer_lock:
+            if _schedule_optimizer is None:
+                _schedule_optimizer = ScheduleOptimizer()
+    return _schedule_optimizer
\ No newline at end of file
@@ -1,4 +1,4 @@
-import json
+import orjson
 import os
 from datetime import datetime
 from typing import List, Dict, Optional
@@ -8,29 +8,88 @@ import logging
 logger = logging.getLogger(__name__)
 
 class RLFeedbackSystem:
-    def __init__(self, history_file="decision_history.json"):
+    def __init__(self, history_file="decision_history.jsonl"):
         self.history_file = history_file
         self.decision_history = self._load_history()
+        # Bumped on every recorded decision so callers can cache derived analytics
+        self.version = 0
+        
+        # Running totals behind get_analytics, so it doesn't rescan the history
+        self._accepted = 0
+        self._rejection_counts: Dict[str, int] = {}
+        self._confidence_sum = 0.0
+        self._confidence_count = 0
+        for decision in self.decision_history:
+            self._count_decision(decision)
         
     def _load_history(self) -> List[Dict]:
         """Load decision history from file"""
-        if os.path.exists(self.history_file):
-            try:
-                with open(self.history_file, 'r') as f:
-                    return json.load(f)
-            except Exception as e:
-                logger.error(f"Error loading history: {e}")
-                return []
-        return []
+        if not os.path.exists(self.history_file):
+            return self._migrate_legacy_history()
+        
+        history = []
+        try:
+            line = b"\n"
+            with open(self.history_file, 'rb') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    # A torn or corrupt line only loses that one decision
+                    try:
+                        history.append(orjson.loads(line))
+                    except orjson.JSONDecodeError as e:
+                        logger.error(f"Skipping malformed history line {line_number}: {e}")
+            
+            # Terminate a torn last line so the next append starts on its own line
+            if not line.endswith(b"\n"):
+                with open(self.history_file, 'ab') as f:
+                    f.write(b"\n")
+        except Exception as e:
+            logger.error(f"Error loading history: {e}")
+        return history
     
-    def _save_history(self):
-        """Save decision history to file"""
+    def _migrate_legacy_history(self) -> List[Dict]:
+        """Convert a history saved by the old single-array JSON format to JSONL"""
+        legacy_file = os.path.splitext(self.history_file)[0] + ".json"
+        if legacy_file == self.history_file or not os.path.exists(legacy_file):
+            return []
+        
+        try:
+            with open(legacy_file, 'rb') as f:
+                history = orjson.loads(f.read())
+            with open(self.history_file, 'wb') as f:
+                f.writelines(
+                    orjson.dumps(decision, default=str, option=orjson.OPT_APPEND_NEWLINE)
+                    for decision in history
+                )
+            logger.info(f"Migrated {len(history)} decisions from {legacy_file} to {self.history_file}")
+            return history
+        except Exception as e:
+            logger.error(f"Error migrating legacy history: {e}")
+            return []
+    
+    def _save_history(self, feedback: Dict):
+        """Append a decision to the history file, one JSON object per line"""
         try:
-            with open(self.history_file, 'w') as f:
-                json.dump(self.decision_history, f, indent=2, default=str)
+            with open(self.history_file, 'ab') as f:
+                f.write(orjson.dumps(feedback, default=str, option=orjson.OPT_APPEND_NEWLINE))
         except Exception as e:
             logger.error(f"Error saving history: {e}")
     
+    def _count_decision(self, decision: Dict):
+        """Add a decision to the running analytics totals"""
+        if decision["action"] == "accept":
+            self._accepted += 1
+        
+        if decision.get("reason"):
+            reason = decision["reason"]
+            self._rejection_counts[reason] = self._rejection_counts.get(reason, 0) + 1
+        
+        context = decision.get("context", {})
+        if "confidence" in context:
+            self._confidence_sum += context["confidence"]
+            self._confidence_count += 1
+    
     def record_decision(self, decision_id: str, action: str, 
                        reason: Optional[RejectionReason] = None,
                        controller_id: Optional[str] = None,
@@ -45,13 +104,15 @@ class RLFeedbackSystem:
             "context": decision_context or {}
         }
         
+        # Update learning signals first so the reward is persisted with the decision
+        self._update_learning_signals(feedback)
+        
         self.decision_history.append(feedback)
-        self._save_history()
+        self._count_decision(feedback)
+        self.version += 1
+        self._save_history(feedback)
         
         logger.info(f"Recorded decision: {decision_id} -> {action}")
-        
-        # Update learning signals
-        self._update_learning_signals(feedback)
     
     def _update_learning_signals(self, feedback: Dict):
         """Update reinforcement learning signals based on feedback"""
@@ -83,17 +144,17 @@ class RLFeedbackSystem:
         feedback["learning_reward"] = reward
     
     def get_decision_history(self, limit: Optional[int] = None) -> List[Dict]:
-        """Get decision history"""
-        history = sorted(self.decision_history, 
-                        key=lambda x: x["timestamp"], reverse=True)
-        
+        """Get decision history, newest first"""
+        # Decisions are appended as they are recorded, so the list is already
+        # in timestamp order and only needs reversing
         if limit:
-            return history[:limit]
-        return history
+            return list(reversed(self.decision_history[-limit:]))
+        return list(reversed(self.decision_history))
     
     def get_analytics(self) -> Dict:
         """Get analytics from decision history"""
-        if not self.decision_history:
+        total = len(self.decision_history)
+        if not total:
             return {
                 "totalDecisions": 0,
                 "acceptedDecisions": 0,
@@ -103,30 +164,18 @@ class RLFeedbackSystem:
                 "averageConfidence": 0.0
             }
         
-        total = len(self.decision_history)
-        accepted = sum(1 for d in self.decision_history if d["action"] == "accept")
+        accepted = self._accepted
         rejected = total - accepted
         
-        # Count rejection reasons
-        rejection_reasons = {}
-        confidences = []
-        
-        for decision in self.decision_history:
-            if decision.get("reason"):
-                reason = decision["reason"]
-                rejection_reasons[reason] = rejection_reasons.get(reason, 0) + 1
-            
-            context = decision.get("context", {})
-            if "confidence" in context:
-                confidences.append(context["confidence"])
-        
         return {
             "totalDecisions": total,
             "acceptedDecisions": accepted,
             "rejectedDecisions": rejected,
             "acceptanceRate": accepted / total if total > 0 else 0.0,
-            "topRejectionReasons": rejection_reasons,
-            "averageConfidence": sum(confidences) / len(confidences) if confidences else 0.0
+            "topRejectionReasons": dict(self._rejection_counts),
+            "averageConfidence": (
+                self._confidence_sum / self._confidence_count if self._confidence_count else 0.0
+            )
         }
     
     def get_learning_insights(self) -> Dict: